@@ -0,0 +1,126 @@
+import asyncio
+import json
+import threading
+import uuid
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+KEEPALIVE_SECONDS = 15
+SUBSCRIBER_QUEUE_SIZE = 100
+HISTORY_SIZE = 256
+
+
+def format_sse(event: str, data: Dict[str, Any], event_id: Optional[str] = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+class ChangeFeed:
+    """
+    Broadcasts knowledge base deltas to connected clients as Server-Sent Events.
+
+    Every change bumps the KB generation. Generations restart with the
+    process, so the SSE event id is "<epoch>-<generation>" with a per-process
+    epoch. A reconnecting EventSource from the same epoch is replayed whatever
+    it missed from a short history. If the epoch differs, the history no
+    longer reaches back far enough, or a client falls too far behind, it gets
+    a "resync" event and should refetch.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._history = deque(maxlen=HISTORY_SIZE)
+        self.epoch = uuid.uuid4().hex[:12]
+        self.generation = 0
+
+    def event_id(self, generation: int) -> str:
+        return f"{self.epoch}-{generation}"
+
+    def _parse_event_id(self, last_event_id: Optional[str]) -> Optional[int]:
+        # Returns the last generation the client saw in this epoch, None for
+        # a fresh client, or -1 when the client has to resync.
+        if not last_event_id:
+            return None
+        epoch, _, generation = last_event_id.rpartition("-")
+        if epoch != self.epoch or not generation.isdigit():
+            return -1
+        return int(generation)
+
+    def publish(self, added: List[str], removed: List[str]) -> int:
+        # Called from the sync endpoints, which FastAPI runs in a worker thread.
+        with self._lock:
+            self.generation += 1
+            delta = {"epoch": self.epoch, "generation": self.generation, "added": added, "removed": removed}
+            self._history.append(delta)
+            subscribers = list(self._subscribers.items())
+        for queue, loop in subscribers:
+            loop.call_soon_threadsafe(self._deliver, queue, delta)
+        print(f"KB generation {delta['generation']}: +{len(added)} -{len(removed)} fact(s)")
+        return delta["generation"]
+
+    @staticmethod
+    def _deliver(queue: asyncio.Queue, delta: Dict[str, Any]):
+        try:
+            queue.put_nowait(("kb_delta", delta))
+        except asyncio.QueueFull:
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(("resync", {"epoch": delta["epoch"], "generation": delta["generation"]}))
+
+    def _subscribe(self, last_seen: Optional[int]):
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[queue] = asyncio.get_running_loop()
+            generation = self.generation
+            missed = []
+            if last_seen is not None and (last_seen < 0 or last_seen > generation):
+                missed = None
+            elif last_seen is not None and last_seen < generation:
+                missed = [d for d in self._history if d["generation"] > last_seen]
+                if not missed or missed[0]["generation"] != last_seen + 1:
+                    missed = None
+        return queue, generation, missed
+
+    def _unsubscribe(self, queue: asyncio.Queue):
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    async def stream(
+        self,
+        last_event_id: Optional[str] = None,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    ) -> AsyncIterator[str]:
+        last_seen = self._parse_event_id(last_event_id)
+        queue, generation, missed = self._subscribe(last_seen)
+        current = {"epoch": self.epoch, "generation": generation}
+        try:
+            if missed is None:
+                yield format_sse("resync", current, self.event_id(generation))
+            else:
+                # hello carries an id so EventSource resumes from it even if no
+                # delta arrives before the connection drops. Its generation is
+                # the one the stream picks up from: the client's own when
+                # deltas are replayed, otherwise the current one.
+                start = generation if last_seen is None else last_seen
+                yield format_sse("hello", {"epoch": self.epoch, "generation": start}, self.event_id(start))
+                for delta in missed:
+                    yield format_sse("kb_delta", delta, self.event_id(delta["generation"]))
+            # Deltas published while replaying may also be queued; clients
+            # drop anything at or below the generation they have applied.
+
+            while True:
+                if is_disconnected is not None and await is_disconnected():
+                    break
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(event, data, self.event_id(data["generation"]))
+        finally:
+            self._unsubscribe(queue)
@@ -1,16 +1,19 @@
-from fastapi import FastAPI, Body
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, Body, Request, Header
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from hyperon import MeTTa, Atom
-from hyperonpy import AtomKind
-from typing import List, Dict, Any
+from hyperon import MeTTa
+from typing import List, Dict, Any, Optional
 from pydantic import BaseModel 
 import os
 import json
 import re  
 import google.generativeai as genai
 from dotenv import load_dotenv
+from backend.metta_utils import atom_to_str, is_symbol
+from backend.sandbox import QuerySandbox
+from backend.changefeed import ChangeFeed
+from backend.partitions import PartitionedKB, is_parent_fact, is_sex_fact, parse_fact
 
 load_dotenv()
 
@@ -31,6 +34,36 @@ app.add_middleware(
 KB_FILE_PATH = os.path.abspath(os.path.join("backend", "logic", "kb.metta"))
 INFER_FILE_PATH = os.path.abspath(os.path.join("backend", "logic", "infer.metta"))
 
+# Budgets for raw MeTTa programs submitted by clients (see backend/sandbox.py)
+RAW_QUERY_TIMEOUT_SECONDS = float(os.getenv("RAW_QUERY_TIMEOUT_SECONDS", "10"))
+RAW_QUERY_MAX_STEPS = int(os.getenv("RAW_QUERY_MAX_STEPS", "200000"))
+RAW_QUERY_MAX_RESULTS = int(os.getenv("RAW_QUERY_MAX_RESULTS", "1000"))
+RAW_QUERY_MAX_WORKERS = int(os.getenv("RAW_QUERY_MAX_WORKERS", "4"))
+RAW_QUERY_MEMORY_LIMIT_MB = int(os.getenv("RAW_QUERY_MEMORY_LIMIT_MB", "512"))
+
+sandbox = QuerySandbox(
+    KB_FILE_PATH,
+    INFER_FILE_PATH,
+    timeout=RAW_QUERY_TIMEOUT_SECONDS,
+    max_steps=RAW_QUERY_MAX_STEPS,
+    max_results=RAW_QUERY_MAX_RESULTS,
+    max_workers=RAW_QUERY_MAX_WORKERS,
+    memory_limit_mb=RAW_QUERY_MEMORY_LIMIT_MB,
+)
+
+kb_feed = ChangeFeed()
+
+# Set KB_PARTITIONS > 0 to serve the KB from partition worker processes
+# (see backend/partitions.py). The main space then holds only the rules from
+# infer.metta, and raw MeTTa queries are disabled since no single space holds
+# every fact. Facts live in kb.metta only, which the partitions load.
+KB_PARTITIONS = int(os.getenv("KB_PARTITIONS", "0"))
+KB_PARTITION_TIMEOUT_SECONDS = float(os.getenv("KB_PARTITION_TIMEOUT_SECONDS", "60"))
+partitioned_kb = (
+    PartitionedKB([KB_FILE_PATH], KB_PARTITIONS, timeout=KB_PARTITION_TIMEOUT_SECONDS)
+    if KB_PARTITIONS > 0 else None
+)
+
 metta = MeTTa()
 def reset_and_reload_metta():
     global metta
@@ -38,10 +71,11 @@ def reset_and_reload_metta():
     metta.run("!(register-module! ../backend)")
     
     try:
-        with open(KB_FILE_PATH, 'r') as f:
-            kb_content = f.read()
-        metta.run(kb_content)
-        print("Successfully loaded KB content from disk.")
+        if partitioned_kb is None:
+            with open(KB_FILE_PATH, 'r') as f:
+                kb_content = f.read()
+            metta.run(kb_content)
+            print("Successfully loaded KB content from disk.")
 
         with open(INFER_FILE_PATH, 'r') as f:
             infer_content = f.read()
@@ -51,9 +85,22 @@ def reset_and_reload_metta():
     except Exception as e:
         print(f"FATAL: Could not read or parse logic files on reset: {e}")
 
+    if partitioned_kb is None:
+        sandbox.refresh()
     print("MeTTa runner reloaded successfully.")
 
 reset_and_reload_metta()
+if partitioned_kb is not None:
+    try:
+        partitioned_kb.reload()
+    except Exception as e:
+        print(f"FATAL: Could not load KB partitions: {e}")
+
+@app.on_event("shutdown")
+def shutdown_workers():
+    sandbox.shutdown()
+    if partitioned_kb is not None:
+        partitioned_kb.shutdown()
 
 class AddFactsPayload(BaseModel):
     facts: List[str]
@@ -66,20 +113,6 @@ def execute_query(query: str) -> List[Dict[str, Any]]:
     print(f"Executing query: {query}")
     try:
         raw_result = metta.run(query)
-        
-        def atom_to_str(atom: Atom) -> Any:
-            metatype = atom.get_metatype()
-            if metatype == AtomKind.SYMBOL:
-                return atom.get_name()
-            elif metatype == AtomKind.EXPR:
-                return [atom_to_str(sub_atom) for sub_atom in atom.get_children()]
-            elif metatype == AtomKind.GROUNDED:
-                try:
-                    return repr(atom.get_object().content)
-                except Exception:
-                    return str(atom)
-            else:
-                return str(atom)
 
         flat_results = [
             atom_to_str(atom)
@@ -100,15 +133,6 @@ def parse_ancestor_paths(query: str) -> List[List[Dict[str, str]]]:
     try:
         raw_result = metta.run(query)
 
-        def atom_to_str(atom: Atom) -> Any:
-            metatype = atom.get_metatype()
-            if metatype == AtomKind.SYMBOL:
-                return atom.get_name()
-            elif metatype == AtomKind.EXPR:
-                return [atom_to_str(sub_atom) for sub_atom in atom.get_children()]
-            else:
-                return str(atom)
-
         if not raw_result or not raw_result[0]:
             return []
 
@@ -136,15 +160,6 @@ def parse_descendant_paths(query: str) -> List[List[Dict[str, str]]]:
     try:
         raw_result = metta.run(query)
 
-        def atom_to_str(atom: Atom) -> Any:
-            metatype = atom.get_metatype()
-            if metatype == AtomKind.SYMBOL:
-                return atom.get_name()
-            elif metatype == AtomKind.EXPR:
-                return [atom_to_str(sub_atom) for sub_atom in atom.get_children()]
-            else:
-                return str(atom)
-
         if not raw_result or not raw_result[0]:
             return []
 
@@ -167,13 +182,46 @@ def parse_descendant_paths(query: str) -> List[List[Dict[str, str]]]:
         print(f"Error parsing descendant paths for query '{query}': {e}")
         return [{"error": str(e)}]
 
+def invalid_name_error(*names: str) -> Optional[List[Dict[str, str]]]:
+    # Names are pasted into MeTTa programs, so only plain symbols are accepted.
+    for name in names:
+        if not is_symbol(name):
+            print(f"Rejecting invalid name: {name!r}")
+            return [{"error": f"Invalid name '{name}': use letters, digits, '_' or '-' only."}]
+    return None
+
+def execute_partitioned(description: str, lookup, person: str, *args) -> List[Any]:
+    print(f"Executing partitioned {description} lookup for {person}")
+    try:
+        result = lookup(person, *args)
+        print(f"Partitioned result: {result}")
+        return result
+    except Exception as e:
+        print(f"Error in partitioned {description} lookup for '{person}': {e}")
+        return [{"error": str(e)}]
+
+async def execute_raw_query(query: str, request: Request) -> List[Any]:
+    if partitioned_kb is not None:
+        return [{"error": "Raw MeTTa queries are not available while the knowledge base is partitioned."}]
+    return await sandbox.run(query, is_disconnected=request.is_disconnected)
+
 
 @app.post("/api/add_facts", summary="Add Facts to Knowledge Base")
 def add_facts(payload: AddFactsPayload):
+    if partitioned_kb is not None:
+        unstorable = []
+        for fact in payload.facts:
+            parsed = parse_fact(fact)
+            if fact.strip() and not (is_parent_fact(parsed) or is_sex_fact(parsed)):
+                unstorable.append(fact)
+        if unstorable:
+            return JSONResponse(status_code=400, content={
+                "detail": f"A partitioned knowledge base only stores (Parent P C), (male P) and (female P) facts of plain names: {unstorable}"
+            })
     try:
         with open(KB_FILE_PATH, "r+") as f:
             existing_facts = {line.strip() for line in f}
-            new_facts_added = 0
+            added_facts = []
             
             f.seek(0, os.SEEK_END)
             if f.tell() > 0:
@@ -182,19 +230,27 @@ def add_facts(payload: AddFactsPayload):
                     f.write('\n')
 
             for fact in payload.facts:
-                if fact.strip() not in existing_facts:
+                fact = fact.strip()
+                if fact and fact not in existing_facts:
                     f.write(f"{fact}\n")
-                    new_facts_added += 1
+                    existing_facts.add(fact)
+                    added_facts.append(fact)
         
-        reset_and_reload_metta()
+        if partitioned_kb is not None:
+            if added_facts:
+                partitioned_kb.add_facts(added_facts)
+        else:
+            reset_and_reload_metta()
         
-        if new_facts_added > 0:
-            message = f"Successfully added {new_facts_added} new fact(s) and reloaded the knowledge base."
+        generation = kb_feed.generation
+        if added_facts:
+            generation = kb_feed.publish(added=added_facts, removed=[])
+            message = f"Successfully added {len(added_facts)} new fact(s) and reloaded the knowledge base."
         else:
             message = "No new facts were added as they already exist in the knowledge base."
             
         print(message)
-        return {"message": message}
+        return {"message": message, "generation": generation}
 
     except Exception as e:
         print(f"Error adding facts: {e}")
@@ -220,66 +276,130 @@ def remove_fact(payload: RemoveFactPayload):
         with open(KB_FILE_PATH, "w") as f:
             f.writelines(lines_kept)
             
-        reset_and_reload_metta()
-        
-        message = f"Successfully removed '{fact_to_remove}' and reloaded the knowledge base."
+        # Only broadcast the removal if the fact really left the loaded KB;
+        # clients would otherwise drop relatives the queries still return.
+        if partitioned_kb is not None:
+            left_kb = partitioned_kb.remove_facts([fact_to_remove]) > 0
+        else:
+            reset_and_reload_metta()
+            left_kb = metta.parse_single(fact_to_remove) not in metta.space().get_atoms()
+
+        if left_kb:
+            generation = kb_feed.publish(added=[], removed=[fact_to_remove])
+            message = f"Successfully removed '{fact_to_remove}' and reloaded the knowledge base."
+        else:
+            generation = kb_feed.generation
+            message = f"Removed '{fact_to_remove}' from kb.metta, but the loaded knowledge base did not change."
         print(message)
-        return {"message": message}
+        return {"message": message, "generation": generation}
 
     except Exception as e:
         print(f"Error removing fact: {e}")
         return JSONResponse(status_code=500, content={"detail": str(e)})
 
+@app.get("/api/changes", summary="Stream Knowledge Base Changes")
+async def stream_changes(request: Request, last_event_id: Optional[str] = Header(None)):
+    return StreamingResponse(
+        kb_feed.stream(last_event_id, is_disconnected=request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 @app.get("/api/children/{person}", summary="Get Children")
 def get_children(person: str):
+    error = invalid_name_error(person)
+    if error:
+        return error
+    if partitioned_kb is not None:
+        return execute_partitioned("children", partitioned_kb.children, person)
     query = f"!(children {person})"
     return execute_query(query)
 
 @app.get("/api/siblings/{person}", summary="Get Siblings")
 def get_siblings(person: str):
+    error = invalid_name_error(person)
+    if error:
+        return error
+    if partitioned_kb is not None:
+        return execute_partitioned("siblings", partitioned_kb.siblings, person)
     query = f"!(sibilings {person})"
     return execute_query(query)
 
 @app.get("/api/aunts-uncles/{person}", summary="Get Aunts and Uncles")
 def get_aunts_uncles(person: str):
+    error = invalid_name_error(person)
+    if error:
+        return error
+    if partitioned_kb is not None:
+        return execute_partitioned("aunts uncles", partitioned_kb.aunts_uncles, person)
     query = f"!(aunts-uncles {person})"
     return execute_query(query)
 
 @app.get("/api/aunts-or-uncles/{person}/{sex}", summary="Get Aunts or Uncles by Sex")
 def get_aunts_or_uncles(person: str, sex: str):
+    error = invalid_name_error(person, sex)
+    if error:
+        return error
+    if partitioned_kb is not None:
+        return execute_partitioned("aunts or uncles", partitioned_kb.aunts_or_uncles, person, sex)
     query = f"!(aunts_or_uncles {person} {sex})"
     return execute_query(query)
 
 @app.get("/api/cousins/{person}", summary="Get Cousins")
 def get_cousins(person: str):
+    error = invalid_name_error(person)
+    if error:
+        return error
+    if partitioned_kb is not None:
+        return execute_partitioned("cousins", partitioned_kb.cousins, person)
     query = f"!(cousins {person})"
     return execute_query(query)
 
 @app.get("/api/sex/{person}", summary="Get Sex")
 def get_sex(person: str):
+    error = invalid_name_error(person)
+    if error:
+        return error
+    if partitioned_kb is not None:
+        return execute_partitioned("sex", partitioned_kb.sex, person)
     query = f"!(get-sex {person})"
     return execute_query(query)
 
 @app.get("/api/ancestors/{person}", summary="Get Ancestors")
 def get_ancestors(person: str):
+    error = invalid_name_error(person)
+    if error:
+        return error
+    if partitioned_kb is not None:
+        return execute_partitioned("ancestor", partitioned_kb.ancestor_paths, person)
     query = f"!(ans {person} ())"
     return parse_ancestor_paths(query)
 
 @app.get("/api/descendants/{person}", summary="Get Descendants")
 def get_descendants(person: str):
+    error = invalid_name_error(person)
+    if error:
+        return error
+    if partitioned_kb is not None:
+        return execute_partitioned("descendant", partitioned_kb.descendant_paths, person)
     query = f"!(decendants {person} ())"
     return parse_descendant_paths(query)
 
 @app.post("/api/query", summary="Execute Raw MeTTa Query")
-def post_raw_query(query_body: Dict[str, str] = Body(..., example={"query": "!(cousins M)"})):
+async def post_raw_query(request: Request, query_body: Dict[str, str] = Body(..., example={"query": "!(cousins M)"})):
     query_str = query_body.get("query")
     if not query_str:
         return {"error": "Request body must contain a 'query' field."}
-    return execute_query(query_str)
+    return await execute_raw_query(query_str, request)
 
 @app.get("/api/sisters-or-brothers/{person}/{sex}", summary="Get Sisters or Brothers")
 def get_sisters_or_brothers(person: str, sex: str):
+    error = invalid_name_error(person, sex)
+    if error:
+        return error
+    if partitioned_kb is not None:
+        return execute_partitioned("sisters or brothers", partitioned_kb.sisters_or_brothers, person, sex)
     query = f"!(sisters_or_brothers {person} {sex})"
     return execute_query(query)
 
@@ -413,7 +533,7 @@ Your Response:
 """
 
 @app.post("/api/natural_query")
-async def natural_language_query(query_body: Dict[str, str] = Body(...)):
+async def natural_language_query(request: Request, query_body: Dict[str, str] = Body(...)):
     try:
         query = query_body.get("query", "").strip()
         if not query:
@@ -422,7 +542,7 @@ async def natural_language_query(query_body: Dict[str, str] = Body(...)):
         print(f"Received query: {query}")
 
         if query.startswith("!(") and query.endswith(")"):
-            return {"message": f"Raw query result: {execute_query(query)}"}
+            return {"message": f"Raw query result: {await execute_raw_query(query, request)}"}
 
         q_lower = query.lower()
 
@@ -0,0 +1,28 @@
+import re
+from typing import Any
+
+from hyperon import Atom
+from hyperonpy import AtomKind
+
+# A plain MeTTa symbol: no whitespace, parentheses, variables ($), quotes or
+# comments, and no leading digit, which MeTTa would parse as a number.
+SYMBOL_PATTERN = re.compile(r"^[^\W\d][\w-]*$")
+
+
+def is_symbol(name: str) -> bool:
+    return bool(SYMBOL_PATTERN.match(name))
+
+
+def atom_to_str(atom: Atom) -> Any:
+    metatype = atom.get_metatype()
+    if metatype == AtomKind.SYMBOL:
+        return atom.get_name()
+    elif metatype == AtomKind.EXPR:
+        return [atom_to_str(sub_atom) for sub_atom in atom.get_children()]
+    elif metatype == AtomKind.GROUNDED:
+        try:
+            return repr(atom.get_object().content)
+        except Exception:
+            return str(atom)
+    else:
+        return str(atom)
@@ -0,0 +1,214 @@
+"""
+Checks the partitioned KB against the single-space rules in infer.metta.
+
+Starts a local PartitionedKB with several worker processes and compares
+every relation the API serves (children, sex, siblings, sisters/brothers,
+aunts/uncles, cousins, ancestor and descendant paths) for every person with
+the answers from one MeTTa space holding the whole KB. It then adds and
+removes a few facts incrementally, the way main.py does, and compares again
+against a freshly built single space.
+
+Run from the repository root:
+
+    python -m backend.partition_check --partitions 4
+    python -m backend.partition_check --partitions 8 --generations 5 --seed 7
+
+Without --generations the facts of kb.metta are checked. With it, a random
+tree is generated instead. Either way the single space is built from the
+de-duplicated facts plus the rules from infer.metta.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List, Set, Tuple
+
+from hyperon import MeTTa
+from backend.metta_utils import atom_to_str
+from backend.partitions import PartitionedKB, SEXES, format_fact, read_facts
+
+KB_FILE_PATH = os.path.abspath(os.path.join("backend", "logic", "kb.metta"))
+INFER_FILE_PATH = os.path.abspath(os.path.join("backend", "logic", "infer.metta"))
+
+Fact = Tuple[str, ...]
+Answers = Dict[str, Dict[str, Set]]
+
+
+def generate_tree(generations: int, seed: int) -> List[Fact]:
+    rng = random.Random(seed)
+    facts = []
+    counter = 0
+
+    def person(sex: str) -> str:
+        nonlocal counter
+        counter += 1
+        facts.append((sex, f"P{counter:05d}"))
+        return f"P{counter:05d}"
+
+    current = [(person("male"), person("female")) for _ in range(2)]
+    for _ in range(generations):
+        children = []
+        for father, mother in current:
+            for _ in range(rng.randint(1, 3)):
+                sex = rng.choice(["male", "female"])
+                child = person(sex)
+                facts.append(("Parent", father, child))
+                facts.append(("Parent", mother, child))
+                children.append((child, sex))
+        current = []
+        for child, sex in children:
+            spouse = person("female" if sex == "male" else "male")
+            current.append((child, spouse) if sex == "male" else (spouse, child))
+    return facts
+
+
+def write_facts(path: str, facts: List[Fact]):
+    with open(path, 'w') as f:
+        f.write("\n".join(format_fact(fact) for fact in facts) + "\n")
+
+
+def paths_of(steps_list) -> Set[Tuple[Tuple[str, str], ...]]:
+    return {tuple((step[0], step[1]) for step in steps) for steps in steps_list if steps}
+
+
+def single_space_answers(facts: List[Fact], rules: str, people: List[str]) -> Answers:
+    runner = MeTTa()
+    runner.run("\n".join(format_fact(fact) for fact in facts) + "\n" + rules)
+
+    def values(query: str) -> Set:
+        return {atom_to_str(atom) for atom in runner.run(query)[0]}
+
+    def paths(query: str) -> Set:
+        return paths_of(list(reversed(atom_to_str(atom))) for atom in runner.run(query)[0])
+
+    answers = {}
+    for name in people:
+        answers[name] = {
+            "children": values(f"!(children {name})"),
+            "sex": values(f"!(get-sex {name})"),
+            "siblings": values(f"!(sibilings {name})"),
+            "aunts-uncles": values(f"!(aunts-uncles {name})"),
+            "cousins": values(f"!(cousins {name})"),
+            "ancestors": paths(f"!(ans {name} ())"),
+            "descendants": paths(f"!(decendants {name} ())"),
+        }
+        for sex in SEXES:
+            answers[name][f"sisters-or-brothers {sex}"] = values(f"!(sisters_or_brothers {name} {sex})")
+            answers[name][f"aunts-or-uncles {sex}"] = values(f"!(aunts_or_uncles {name} {sex})")
+    return answers
+
+
+def partitioned_answers(kb: PartitionedKB, people: List[str]) -> Answers:
+    def paths(result) -> Set:
+        return paths_of([(step["name"], step["sex"]) for step in path] for path in result)
+
+    answers = {}
+    for name in people:
+        answers[name] = {
+            "children": set(kb.children(name)),
+            "sex": set(kb.sex(name)),
+            "siblings": set(kb.siblings(name)),
+            "aunts-uncles": set(kb.aunts_uncles(name)),
+            "cousins": set(kb.cousins(name)),
+            "ancestors": paths(kb.ancestor_paths(name)),
+            "descendants": paths(kb.descendant_paths(name)),
+        }
+        for sex in SEXES:
+            answers[name][f"sisters-or-brothers {sex}"] = set(kb.sisters_or_brothers(name, sex))
+            answers[name][f"aunts-or-uncles {sex}"] = set(kb.aunts_or_uncles(name, sex))
+    return answers
+
+
+def compare(expected: Answers, actual: Answers) -> int:
+    mismatches = 0
+    for name in sorted(expected):
+        for key in sorted(expected[name]):
+            if expected[name][key] != actual[name][key]:
+                mismatches += 1
+                print(f"MISMATCH {key} of {name}:")
+                print(f"  single space: {sorted(expected[name][key])}")
+                print(f"  partitioned:  {sorted(actual[name][key])}")
+    return mismatches
+
+
+def plan_updates(facts: List[Fact], seed: int) -> Tuple[List[Fact], List[Fact]]:
+    # A newborn under an existing leaf, an existing root linked under another
+    # leaf so two lineages are joined, one removed link and one removed sex.
+    rng = random.Random(seed)
+    parent_facts = [fact for fact in facts if fact[0] == "Parent"]
+    children = {fact[2] for fact in parent_facts}
+    parents = {fact[1] for fact in parent_facts}
+    roots = sorted(parents - children)
+    leaves = sorted(children - parents)
+
+    leaf, other_leaf = rng.sample(leaves, 2)
+    root = rng.choice(roots)
+    added = [("female", "Newborn"), ("Parent", leaf, "Newborn"), ("Parent", other_leaf, root)]
+
+    removed_link = rng.choice([fact for fact in parent_facts if fact[2] != root])
+    sexed = sorted(fact for fact in facts if fact[0] in SEXES and fact[1] not in (leaf, other_leaf, root))
+    removed = [removed_link, rng.choice(sexed)]
+    return added, removed
+
+
+def check(partitions: int, generations: int = 0, seed: int = 0) -> int:
+    with open(INFER_FILE_PATH, 'r') as f:
+        rules = f.read()
+    if generations > 0:
+        facts = generate_tree(generations, seed)
+    else:
+        facts = read_facts([KB_FILE_PATH])
+    facts = list(dict.fromkeys(facts))
+
+    mismatches = 0
+    with tempfile.TemporaryDirectory() as workdir:
+        kb_path = os.path.join(workdir, "kb.metta")
+        write_facts(kb_path, facts)
+
+        kb = PartitionedKB([kb_path], partitions)
+        try:
+            kb.reload()
+            for stage in ("initial", "updated"):
+                if stage == "updated":
+                    added, removed = plan_updates(facts, seed)
+                    print(f"Adding {[format_fact(f) for f in added]}, removing {[format_fact(f) for f in removed]}")
+                    facts = [fact for fact in facts if fact not in removed] + added
+                    write_facts(kb_path, facts)
+                    kb.add_facts([format_fact(fact) for fact in added])
+                    kb.remove_facts([format_fact(fact) for fact in removed])
+
+                people = sorted({name for fact in facts for name in fact[1:]})
+                print(f"[{stage}] Checking {len(people)} people across {partitions} partition(s).")
+
+                start = time.monotonic()
+                expected = single_space_answers(facts, rules, people)
+                print(f"[{stage}] Single space: {time.monotonic() - start:.2f}s")
+
+                start = time.monotonic()
+                actual = partitioned_answers(kb, people)
+                print(f"[{stage}] Partitioned:  {time.monotonic() - start:.2f}s")
+
+                mismatches += compare(expected, actual)
+        finally:
+            kb.shutdown()
+
+    if mismatches:
+        print(f"FAILED: {mismatches} mismatch(es).")
+        return 1
+    print("OK: partitioned results match the single space.")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--partitions", type=int, default=4, help="number of partition worker processes")
+    parser.add_argument("--generations", type=int, default=0, help="check a generated tree of this depth instead of kb.metta")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the generated tree and the updates")
+    args = parser.parse_args()
+    return check(args.partitions, args.generations, args.seed)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
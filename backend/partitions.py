@@ -0,0 +1,473 @@
+import itertools
+import multiprocessing
+import re
+import threading
+import time
+import zlib
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from hyperon import E, S, V, Atom, MeTTa
+from backend.metta_utils import atom_to_str, is_symbol
+
+# A partitioned view of the knowledge base for trees too large for one space.
+# People are assigned to partitions by a hash of their ID. Every partition
+# runs in its own process with its own interpreter, and holds:
+#   - (Parent P C) when it owns P or C, so parent and child lookups for the
+#     people it owns never leave the partition
+#   - sex facts for every person mentioned in those Parent facts, so related
+#     people come back with their sex in the same round trip
+# Partitions load their own share straight from the KB files, and later
+# changes are sent only to the partitions that hold the affected facts; the
+# coordinator in main.py never holds the whole KB.
+# Workers never parse MeTTa from requests: facts and names are checked to be
+# plain symbols and turned into atoms, and lookups are space queries.
+# Traversals run in the coordinator as a breadth-first frontier expansion:
+# each generation is scattered to the owning partitions and the answers are
+# gathered before the next generation is expanded.
+_mp = multiprocessing.get_context("spawn")
+
+# Raised by a pipe whose worker died, by a worker that does not answer in time
+# (TimeoutError is an OSError), or by a worker that could not be reloaded.
+WORKER_ERRORS = (EOFError, OSError, RuntimeError)
+
+FACT_PATTERN = re.compile(r"^\((?!=\s)([^\s()]+)((?:\s+[^\s()]+)+)\)\s*$")
+SEXES = ("male", "female")
+
+
+def parse_fact(line: str):
+    match = FACT_PATTERN.match(line.strip())
+    if not match:
+        return None
+    fact = (match.group(1),) + tuple(match.group(2).split())
+    if not all(is_symbol(part) for part in fact):
+        return None
+    return fact
+
+
+def format_fact(fact: Tuple[str, ...]) -> str:
+    return f"({' '.join(fact)})"
+
+
+def read_facts(paths: Iterable[str]) -> List[Tuple[str, ...]]:
+    facts = {}
+    for path in paths:
+        with open(path, 'r') as f:
+            for line in f:
+                fact = parse_fact(line)
+                if fact is not None:
+                    facts[fact] = None
+    return list(facts)
+
+
+def owner(person: str, count: int) -> int:
+    return zlib.crc32(person.encode("utf-8")) % count
+
+
+def is_parent_fact(fact) -> bool:
+    return fact is not None and fact[0] == "Parent" and len(fact) == 3
+
+
+def is_sex_fact(fact) -> bool:
+    return fact is not None and fact[0] in SEXES and len(fact) == 2
+
+
+def fact_atom(fact: Tuple[str, ...]) -> Atom:
+    return E(*[S(part) for part in fact])
+
+
+def _parents_pattern(name: str) -> Atom:
+    return E(S("Parent"), V("r"), S(name))
+
+
+def _children_pattern(name: str) -> Atom:
+    return E(S("Parent"), S(name), V("r"))
+
+
+def _sex_pattern(name: str) -> Atom:
+    return E(V("r"), S(name))
+
+
+def _partition_worker(conn):
+    space = MeTTa().space()
+    index, count = 0, 1
+
+    def lookup(pattern, names: List[str]) -> Dict[str, List[str]]:
+        return {
+            name: sorted({atom_to_str(bindings["r"]) for bindings in space.query(pattern(name))})
+            for name in names
+        }
+
+    def related(pattern, names: List[str]) -> Dict[str, List[List[Any]]]:
+        relatives = lookup(pattern, names)
+        sexes = lookup(_sex_pattern, sorted({r for rs in relatives.values() for r in rs}))
+        return {
+            name: [[r, [s for s in sexes.get(r, []) if s in SEXES]] for r in rs]
+            for name, rs in relatives.items()
+        }
+
+    def to_fact(fact: str) -> Tuple[str, ...]:
+        parsed = parse_fact(fact)
+        if parsed is None:
+            raise ValueError(f"Not a fact of plain symbols: {fact}")
+        return parsed
+
+    def contains(fact: Tuple[str, ...]) -> bool:
+        return bool(list(space.query(fact_atom(fact))))
+
+    def load(fact_paths: List[str]) -> int:
+        # Two passes over the files so only this partition's share is ever held.
+        mentioned = set()
+        facts = {}
+        for path in fact_paths:
+            with open(path, 'r') as f:
+                for line in f:
+                    fact = parse_fact(line)
+                    if is_parent_fact(fact) and index in (owner(fact[1], count), owner(fact[2], count)):
+                        facts[fact] = None
+                        mentioned.update(fact[1:])
+        for path in fact_paths:
+            with open(path, 'r') as f:
+                for line in f:
+                    fact = parse_fact(line)
+                    if is_sex_fact(fact) and (fact[1] in mentioned or owner(fact[1], count) == index):
+                        facts[fact] = None
+        for fact in facts:
+            space.add_atom(fact_atom(fact))
+        return len(facts)
+
+    def add(facts: List[str]) -> int:
+        added = 0
+        for fact in map(to_fact, facts):
+            if not contains(fact):
+                space.add_atom(fact_atom(fact))
+                added += 1
+        return added
+
+    def remove(facts: List[str]) -> int:
+        removed = 0
+        unlinked = set()
+        for fact in map(to_fact, facts):
+            if space.remove_atom(fact_atom(fact)):
+                removed += 1
+                if is_parent_fact(fact):
+                    unlinked.update(fact[1:])
+        # Drop copied sex facts of people this partition no longer mentions.
+        for name in unlinked:
+            if owner(name, count) == index:
+                continue
+            if list(space.query(_children_pattern(name))) or list(space.query(_parents_pattern(name))):
+                continue
+            for sex in lookup(_sex_pattern, [name]).get(name, []):
+                if sex in SEXES:
+                    space.remove_atom(fact_atom((sex, name)))
+        return removed
+
+    while True:
+        try:
+            request_id, op, payload = conn.recv()
+        except EOFError:
+            break
+        if op == "stop":
+            break
+        try:
+            if op == "load":
+                index, count, fact_paths = payload
+                space = MeTTa().space()
+                reply = load(fact_paths)
+            elif op == "add":
+                reply = add(payload)
+            elif op == "remove":
+                reply = remove(payload)
+            elif op == "parents":
+                reply = related(_parents_pattern, payload)
+            elif op == "children":
+                reply = related(_children_pattern, payload)
+            elif op == "sex":
+                reply = {
+                    name: [s for s in sexes if s in SEXES]
+                    for name, sexes in lookup(_sex_pattern, payload).items()
+                }
+            else:
+                raise ValueError(f"Unknown partition operation '{op}'")
+            conn.send((request_id, "ok", reply))
+        except Exception as e:
+            conn.send((request_id, "error", str(e)))
+    conn.close()
+
+
+class PartitionedKB:
+    """
+    Coordinator for a knowledge base split across worker processes.
+
+    Lookups for a person go to the partition that owns them. Traversals expand
+    one generation at a time, batching every frontier person bound for the
+    same partition into a single request. The sibling, aunt/uncle and cousin
+    relations are composed from parent and child lookups in the same way.
+
+    Paths have the same shape as the single-space /api/ancestors and
+    /api/descendants results: nearest relative first, {"name", "sex"} per
+    step. As with the ans/decendants rules in infer.metta, a relative with no
+    recorded sex is not followed, and one with several sexes yields a path
+    per sex. Duplicate facts are stored once, so repeated paths collapse.
+
+    Each worker has its own lock, so requests for different partitions run
+    concurrently. Workers are started on first use. A worker that has died is
+    restarted and reloaded from the KB files before it is used again. If a
+    worker fails during a request, it is restarted the same way and the request
+    raises RuntimeError. A worker counts as failed when it has not answered
+    within timeout seconds, even if it is still running.
+    """
+
+    def __init__(self, fact_paths: List[str], count: int, timeout: float = 60):
+        self.fact_paths = fact_paths
+        self.count = count
+        self.timeout = timeout
+        self._locks = [threading.Lock() for _ in range(count)]
+        self._workers = [None] * count
+        self._request_ids = itertools.count(1)
+
+    # The helpers below expect the caller to hold self._locks[index].
+
+    def _stop(self, index: int):
+        worker = self._workers[index]
+        self._workers[index] = None
+        if worker is None:
+            return
+        process, conn = worker
+        if process.is_alive():
+            process.kill()
+        process.join()
+        conn.close()
+
+    def _restart(self, index: int, load: bool = True):
+        self._stop(index)
+        parent_conn, child_conn = _mp.Pipe()
+        process = _mp.Process(target=_partition_worker, args=(child_conn,), daemon=True)
+        process.start()
+        child_conn.close()
+        self._workers[index] = (process, parent_conn)
+        if load:
+            status, payload = self._receive(index, self._send(index, "load", (index, self.count, self.fact_paths)))
+            if status != "ok":
+                raise RuntimeError(f"Partition {index} could not be reloaded: {payload}")
+
+    def _send(self, index: int, op: str, payload: Any) -> int:
+        if self._workers[index] is None or not self._workers[index][0].is_alive():
+            # A load request fills the fresh worker itself.
+            self._restart(index, load=op != "load")
+        request_id = next(self._request_ids)
+        self._workers[index][1].send((request_id, op, payload))
+        return request_id
+
+    def _receive(self, index: int, request_id: int) -> Tuple[str, Any]:
+        conn = self._workers[index][1]
+        deadline = time.monotonic() + self.timeout
+        while True:
+            # A dead worker makes poll() return at once and recv() raise EOFError.
+            if not conn.poll(max(deadline - time.monotonic(), 0)):
+                raise TimeoutError(f"no reply to request {request_id} within {self.timeout} seconds")
+            reply_id, status, payload = conn.recv()
+            if reply_id == request_id:
+                return status, payload
+            print(f"Partition {index}: discarding stale reply to request {reply_id}.")
+
+    def _scatter(self, requests: Dict[int, Tuple[str, Any]]) -> Dict[int, Any]:
+        # Locks are always taken in partition order so scatters cannot deadlock.
+        indices = sorted(requests)
+        for index in indices:
+            self._locks[index].acquire()
+        try:
+            sent, replies, failed = {}, {}, {}
+            for index in indices:
+                try:
+                    sent[index] = self._send(index, *requests[index])
+                except WORKER_ERRORS as e:
+                    failed[index] = e
+            # Every worker that was sent a request is read back, even after a
+            # failure, so no reply is left behind in its pipe.
+            for index, request_id in sent.items():
+                try:
+                    replies[index] = self._receive(index, request_id)
+                except WORKER_ERRORS as e:
+                    failed[index] = e
+            for index, error in failed.items():
+                print(f"Partition {index} failed ({error!r}); restarting it.")
+                try:
+                    self._restart(index)
+                except WORKER_ERRORS as e:
+                    print(f"Partition {index} could not be restarted ({e!r}); retrying on next use.")
+                    self._stop(index)
+        finally:
+            for index in reversed(indices):
+                self._locks[index].release()
+
+        if failed:
+            details = "; ".join(f"partition {index}: {error!r}" for index, error in sorted(failed.items()))
+            raise RuntimeError(f"KB partition worker(s) failed and were restarted: {details}")
+
+        gathered = {}
+        for index, (status, payload) in replies.items():
+            if status != "ok":
+                raise RuntimeError(f"Partition {index} failed: {payload}")
+            gathered[index] = payload
+        return gathered
+
+    def _route(self, op: str, names: Iterable[str]) -> Dict[str, Any]:
+        by_partition = defaultdict(list)
+        for name in sorted(set(names)):
+            if not is_symbol(name):
+                raise ValueError(f"Invalid person name '{name}'.")
+            by_partition[owner(name, self.count)].append(name)
+        if not by_partition:
+            return {}
+        gathered = self._scatter({index: (op, batch) for index, batch in by_partition.items()})
+        merged = {}
+        for reply in gathered.values():
+            merged.update(reply)
+        return merged
+
+    def _send_facts(self, op: str, facts_by_partition: Dict[int, List[str]]) -> int:
+        requests = {index: (op, facts) for index, facts in facts_by_partition.items() if facts}
+        if not requests:
+            return 0
+        return sum(self._scatter(requests).values())
+
+    def _holders(self, names: Iterable[str]) -> Dict[str, Set[int]]:
+        # A person's facts live with their owner and with the owner of every
+        # parent or child they are linked to.
+        names = set(names)
+        holders = {name: {owner(name, self.count)} for name in names}
+        for op in ("parents", "children"):
+            for name, relatives in self._route(op, names).items():
+                holders[name].update(owner(r, self.count) for r, _ in relatives)
+        return holders
+
+    def reload(self):
+        sizes = self._scatter({
+            index: ("load", (index, self.count, self.fact_paths)) for index in range(self.count)
+        })
+        print(f"Loaded {self.count} KB partition(s) with {[sizes[i] for i in range(self.count)]} fact(s).")
+
+    def add_facts(self, facts: List[str]):
+        parsed = [parse_fact(fact) for fact in facts]
+        sex_facts = [fact for fact in parsed if is_sex_fact(fact)]
+        parent_facts = [fact for fact in parsed if is_parent_fact(fact)]
+
+        # Sex facts first, so the Parent facts below copy up-to-date sexes.
+        batches = defaultdict(list)
+        holders = self._holders(fact[1] for fact in sex_facts)
+        for fact in sex_facts:
+            for index in holders[fact[1]]:
+                batches[index].append(format_fact(fact))
+        added = self._send_facts("add", batches)
+
+        batches = defaultdict(list)
+        sexes = self._route("sex", {name for fact in parent_facts for name in fact[1:]})
+        for fact in parent_facts:
+            linked = [format_fact(fact)]
+            for name in fact[1:]:
+                linked.extend(f"({sex} {name})" for sex in sexes.get(name, []))
+            for index in {owner(fact[1], self.count), owner(fact[2], self.count)}:
+                batches[index].extend(linked)
+        added += self._send_facts("add", batches)
+        print(f"Sent {len(sex_facts) + len(parent_facts)} new fact(s) to KB partitions ({added} stored).")
+
+    def remove_facts(self, facts: List[str]) -> int:
+        parsed = [parse_fact(fact) for fact in facts]
+        batches = defaultdict(list)
+        holders = self._holders(fact[1] for fact in parsed if is_sex_fact(fact))
+        for fact in parsed:
+            if is_parent_fact(fact):
+                for index in {owner(fact[1], self.count), owner(fact[2], self.count)}:
+                    batches[index].append(format_fact(fact))
+            elif is_sex_fact(fact):
+                for index in holders[fact[1]]:
+                    batches[index].append(format_fact(fact))
+        removed = self._send_facts("remove", batches)
+        print(f"Removed {len(facts)} fact(s) from KB partitions ({removed} stored copies).")
+        return removed
+
+    def shutdown(self):
+        for index in range(self.count):
+            with self._locks[index]:
+                if self._workers[index] is None:
+                    continue
+                process, conn = self._workers[index]
+                try:
+                    conn.send((None, "stop", None))
+                except (BrokenPipeError, OSError):
+                    pass
+                process.join(timeout=1)
+                self._stop(index)
+
+    def children(self, person: str) -> List[str]:
+        return [name for name, _ in self._route("children", [person]).get(person, [])]
+
+    def sex(self, person: str) -> List[str]:
+        return self._route("sex", [person]).get(person, [])
+
+    def _siblings(self, names: Iterable[str]) -> Dict[str, Dict[str, List[str]]]:
+        # Mirrors sibilings in infer.metta: children of any parent, minus the person.
+        names = set(names)
+        parents = self._route("parents", names)
+        children = self._route("children", {p for rs in parents.values() for p, _ in rs})
+        siblings = {}
+        for name in names:
+            found = {}
+            for parent, _ in parents.get(name, []):
+                for child, sexes in children.get(parent, []):
+                    if child != name:
+                        found[child] = sexes
+            siblings[name] = found
+        return siblings
+
+    def siblings(self, person: str) -> List[str]:
+        return sorted(self._siblings([person])[person])
+
+    def sisters_or_brothers(self, person: str, sex: str) -> List[str]:
+        return sorted(name for name, sexes in self._siblings([person])[person].items() if sex in sexes)
+
+    def _aunts_uncles(self, person: str) -> Dict[str, List[str]]:
+        parents = [p for p, _ in self._route("parents", [person]).get(person, [])]
+        found = {}
+        for relatives in self._siblings(parents).values():
+            found.update(relatives)
+        return found
+
+    def aunts_uncles(self, person: str) -> List[str]:
+        return sorted(self._aunts_uncles(person))
+
+    def aunts_or_uncles(self, person: str, sex: str) -> List[str]:
+        return sorted(name for name, sexes in self._aunts_uncles(person).items() if sex in sexes)
+
+    def cousins(self, person: str) -> List[str]:
+        children = self._route("children", self._aunts_uncles(person))
+        return sorted({child for relatives in children.values() for child, _ in relatives})
+
+    def _traverse(self, person: str, op: str) -> List[List[Dict[str, str]]]:
+        complete = []
+        frontier = [(person, [])]
+        while frontier:
+            relatives = self._route(op, {tail for tail, _ in frontier})
+            next_frontier = []
+            for tail, path in frontier:
+                seen = {person} | {step["name"] for step in path}
+                # Relatives already on the path would loop forever; a cyclic
+                # KB never terminates under the single-space rules either.
+                extensions = [(name, sexes) for name, sexes in relatives.get(tail, []) if name not in seen]
+                if not extensions:
+                    if path:
+                        complete.append(path)
+                    continue
+                for name, sexes in extensions:
+                    for sex in sexes:
+                        next_frontier.append((name, path + [{"name": name, "sex": sex}]))
+            frontier = next_frontier
+        return complete
+
+    def ancestor_paths(self, person: str) -> List[List[Dict[str, str]]]:
+        return self._traverse(person, "parents")
+
+    def descendant_paths(self, person: str) -> List[List[Dict[str, str]]]:
+        return self._traverse(person, "children")
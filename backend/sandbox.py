@@ -0,0 +1,221 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from typing import Any, Awaitable, Callable, List, Optional
+
+import hyperonpy as hp
+from hyperon import MeTTa, Atom, RunnerState
+from backend.metta_utils import atom_to_str
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Raw MeTTa programs come straight from the client, so each one is evaluated in
+# a throwaway process with its own interpreter. An over-budget or abandoned
+# query is killed outright instead of tying up the shared runner in main.py.
+_mp = multiprocessing.get_context("spawn")
+
+POLL_INTERVAL_SECONDS = 0.02
+
+
+def _hashable(value: Any) -> Any:
+    if isinstance(value, list):
+        return tuple(_hashable(v) for v in value)
+    return value
+
+
+def _query_worker(conn, kb_path: str, infer_path: str, max_steps: int, max_results: int, memory_limit_mb: int):
+    try:
+        if resource is not None and memory_limit_mb > 0:
+            limit = memory_limit_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+        runner = MeTTa()
+        runner.run("!(register-module! ../backend)")
+        with open(kb_path, 'r') as f:
+            runner.run(f.read())
+        with open(infer_path, 'r') as f:
+            runner.run(f.read())
+        conn.send(("ready",))
+
+        query = conn.recv()
+        state = RunnerState(runner, query)
+        steps = 0
+        while not state.is_complete():
+            if steps >= max_steps:
+                conn.send(("error", f"Query exceeded the reduction budget of {max_steps} steps."))
+                return
+            state.run_step()
+            steps += 1
+
+        # Wrap and convert results one at a time so a huge result set stops
+        # costing anything once max_results unique values have been collected.
+        unique_results = []
+        seen = set()
+        truncated = False
+        for result_set in hp.runner_state_current_results(state.cstate):
+            for catom in result_set:
+                value = atom_to_str(Atom._from_catom(catom))
+                key = _hashable(value)
+                if key in seen:
+                    continue
+                if len(unique_results) >= max_results:
+                    truncated = True
+                    break
+                seen.add(key)
+                unique_results.append(value)
+            if truncated:
+                break
+
+        conn.send(("ok", unique_results, truncated, steps))
+    except EOFError:
+        pass
+    except Exception as e:
+        conn.send(("error", str(e)))
+    finally:
+        conn.close()
+
+
+class QuerySandbox:
+    """
+    Runs raw MeTTa queries in single-use worker processes under wall-clock,
+    reduction-step, result-size and memory budgets. At most max_workers
+    queries run at once; further queries are refused until one finishes.
+
+    Loading the knowledge base is the slow part of starting a worker, so one
+    spare is always kept warm: each query takes the spare and a replacement is
+    started straight away. Call refresh() whenever the KB files change.
+    """
+
+    def __init__(
+        self,
+        kb_path: str,
+        infer_path: str,
+        timeout: float,
+        max_steps: int,
+        max_results: int,
+        max_workers: int = 4,
+        memory_limit_mb: int = 512,
+        startup_timeout: float = 60,
+    ):
+        self.kb_path = kb_path
+        self.infer_path = infer_path
+        self.timeout = timeout
+        self.max_steps = max_steps
+        self.max_results = max_results
+        self.max_workers = max_workers
+        self.memory_limit_mb = memory_limit_mb
+        self.startup_timeout = startup_timeout
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._lock = threading.Lock()
+        self._spare = None
+
+    def _spawn(self):
+        parent_conn, child_conn = _mp.Pipe()
+        process = _mp.Process(
+            target=_query_worker,
+            args=(child_conn, self.kb_path, self.infer_path, self.max_steps, self.max_results, self.memory_limit_mb),
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        return process, parent_conn
+
+    @staticmethod
+    def _stop(worker):
+        process, conn = worker
+        if process.is_alive():
+            process.kill()
+        process.join()
+        conn.close()
+
+    def _take_worker(self):
+        with self._lock:
+            worker = self._spare
+            self._spare = self._spawn()
+        if worker is None or not worker[0].is_alive():
+            if worker is not None:
+                self._stop(worker)
+            worker = self._spawn()
+        return worker
+
+    def refresh(self):
+        with self._lock:
+            stale = self._spare
+            self._spare = self._spawn()
+        if stale is not None:
+            self._stop(stale)
+
+    def shutdown(self):
+        with self._lock:
+            stale = self._spare
+            self._spare = None
+        if stale is not None:
+            self._stop(stale)
+
+    async def run(self, query: str, is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None) -> List[Any]:
+        print(f"Executing sandboxed query: {query}")
+        if not self._slots.acquire(blocking=False):
+            print(f"Refusing query '{query}': {self.max_workers} raw queries already running.")
+            return [{"error": f"Too many raw queries are running (limit {self.max_workers}). Try again shortly."}]
+        try:
+            return await self._run(query, is_disconnected)
+        finally:
+            self._slots.release()
+
+    async def _run(self, query: str, is_disconnected: Optional[Callable[[], Awaitable[bool]]]) -> List[Any]:
+        # Starting, feeding and joining worker processes can block, so that is
+        # done in a thread to keep the event loop (and the SSE streams) moving.
+        worker = await asyncio.to_thread(self._take_worker)
+        process, conn = worker
+
+        # The query budget only starts once the worker has finished loading
+        # the KB; until then the worker gets startup_timeout to get ready.
+        started = time.monotonic()
+        deadline = None
+        message = None
+        try:
+            await asyncio.to_thread(conn.send, query)
+            while True:
+                finished = not process.is_alive()
+                if conn.poll():
+                    try:
+                        message = conn.recv()
+                    except EOFError:
+                        break
+                    if message[0] == "ready":
+                        deadline = time.monotonic() + self.timeout
+                        message = None
+                        continue
+                    break
+                if finished:
+                    break
+                if deadline is None and time.monotonic() > started + self.startup_timeout:
+                    print(f"Query worker for '{query}' did not start within {self.startup_timeout}s; killing it.")
+                    return [{"error": f"Query worker did not start within {self.startup_timeout} seconds."}]
+                if deadline is not None and time.monotonic() > deadline:
+                    print(f"Query '{query}' exceeded {self.timeout}s wall-clock budget; killing worker.")
+                    return [{"error": f"Query exceeded the time budget of {self.timeout} seconds."}]
+                if is_disconnected is not None and await is_disconnected():
+                    print(f"Client disconnected; cancelling query '{query}'.")
+                    return [{"error": "Query cancelled because the client disconnected."}]
+                await asyncio.sleep(POLL_INTERVAL_SECONDS)
+        except (BrokenPipeError, OSError) as e:
+            print(f"Query worker failed for '{query}': {e}")
+        finally:
+            await asyncio.to_thread(self._stop, worker)
+
+        if message is None:
+            return [{"error": f"Query worker exited unexpectedly (exit code {process.exitcode})."}]
+        if message[0] == "error":
+            print(f"Error executing query '{query}': {message[1]}")
+            return [{"error": message[1]}]
+
+        _, unique_results, truncated, steps = message
+        print(f"Query result ({steps} steps): {unique_results}")
+        if truncated:
+            unique_results.append({"warning": f"Result truncated to the first {self.max_results} results."})
+        return unique_results
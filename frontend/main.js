@@ -723,12 +723,218 @@ async function handleKbUpdate(action) {
     }
 }
 
+// Live knowledge base change feed (Server-Sent Events)
+let kbEpoch = null;
+let kbGeneration = 0;
+let kbEvents = null;
+let kbDeltaQueue = Promise.resolve();
+
+function connectKbFeed() {
+    if (typeof EventSource === 'undefined') {
+        console.warn("EventSource not supported, live KB updates disabled");
+        return;
+    }
+
+    // EventSource reconnects on its own and sends Last-Event-ID, so the
+    // server replays any deltas we missed (or tells us to resync)
+    kbEvents = new EventSource(`${API_BASE}/changes`);
+
+    kbEvents.addEventListener('hello', (evt) => {
+        const data = JSON.parse(evt.data);
+        console.log("Connected to KB change feed at generation", data.generation);
+        if (kbEpoch === null) {
+            kbEpoch = data.epoch;
+            kbGeneration = data.generation;
+        } else if (kbEpoch !== data.epoch || data.generation > kbGeneration) {
+            // The server restarted or moved on without replaying what we missed
+            resyncKbFeed(data);
+        }
+    });
+
+    kbEvents.addEventListener('kb_delta', (evt) => {
+        const delta = JSON.parse(evt.data);
+        if (delta.epoch !== kbEpoch || delta.generation <= kbGeneration) return;
+        kbGeneration = delta.generation;
+        // Apply deltas one at a time, since applying one may wait on a lineage fetch
+        kbDeltaQueue = kbDeltaQueue.then(() => applyKbDelta(delta)).catch(error => {
+            console.error("Could not apply KB delta, refetching tree:", error);
+            if (currentPerson) {
+                visualizePersonFamilyTree(currentPerson);
+            }
+        });
+    });
+
+    kbEvents.addEventListener('resync', (evt) => {
+        resyncKbFeed(JSON.parse(evt.data));
+    });
+
+    kbEvents.onerror = () => {
+        console.warn("KB change feed disconnected, retrying...");
+    };
+}
+
+// Refetch the current tree and continue from the server's generation
+function resyncKbFeed(data) {
+    console.warn("Resyncing with the KB change feed at generation", data.generation);
+    kbEpoch = data.epoch;
+    kbGeneration = data.generation;
+    if (currentPerson) {
+        visualizePersonFamilyTree(currentPerson);
+    }
+}
+
+// Parse a fact like "(Parent Adam Charles)" or "(male Adam)"
+function parseFact(fact) {
+    const match = fact.trim().match(/^\((\S+)\s+([^\s()]+)(?:\s+([^\s()]+))?\)$/);
+    if (!match) return null;
+    return { head: match[1], args: match[3] ? [match[2], match[3]] : [match[2]] };
+}
+
+function dedupePaths(paths) {
+    const seen = new Set();
+    return paths.filter(path => {
+        if (path.length === 0) return false;
+        const key = path.map(person => person.name).join('>');
+        if (seen.has(key)) return false;
+        seen.add(key);
+        return true;
+    });
+}
+
+// Fetch the existing ancestor or descendant paths of someone newly linked into the tree
+async function fetchLineage(kind, personName) {
+    const response = await fetch(`${API_BASE}/${kind}/${encodeURIComponent(personName)}`);
+    if (!response.ok) {
+        throw new Error(`API error: ${response.status}`);
+    }
+    const paths = await response.json();
+    if (!Array.isArray(paths) || paths.some(path => !Array.isArray(path))) {
+        throw new Error(`Unexpected ${kind} response for ${personName}`);
+    }
+    return paths;
+}
+
+// Patch the cached lineages with a KB delta and redraw locally instead of refetching
+async function applyKbDelta(delta) {
+    console.log("Applying KB delta:", delta);
+    if (!currentPerson) return;
+    const person = currentPerson;
+
+    const added = (delta.added || []).map(parseFact).filter(Boolean);
+    const removed = (delta.removed || []).map(parseFact).filter(Boolean);
+
+    const sexes = {};
+    added.forEach(fact => {
+        if ((fact.head === 'male' || fact.head === 'female') && fact.args.length === 1) {
+            sexes[fact.args[0]] = fact.head;
+        }
+    });
+
+    const knownSex = (name) => {
+        if (sexes[name]) return sexes[name];
+        const node = cy ? cy.nodes().filter(n => n.data('name') === name) : null;
+        return node && node.length ? node.data('sex') : 'unknown';
+    };
+
+    // In both path lists, path[i] is one generation further from currentPerson than path[i - 1]
+    const nameAt = (path, i) => (i === 0 ? currentPerson : path[i - 1].name);
+
+    let ancestors = treeData.ancestors.map(path => path.slice());
+    let descendants = treeData.descendants.map(path => path.slice());
+    let changed = false;
+
+    removed.forEach(fact => {
+        if (fact.head !== 'Parent' || fact.args.length !== 2) return;
+        const [parent, child] = fact.args;
+
+        ancestors = ancestors.map(path => {
+            const i = path.findIndex((person, idx) => person.name === parent && nameAt(path, idx) === child);
+            if (i === -1) return path;
+            changed = true;
+            return path.slice(0, i);
+        });
+        descendants = descendants.map(path => {
+            const i = path.findIndex((person, idx) => person.name === child && nameAt(path, idx) === parent);
+            if (i === -1) return path;
+            changed = true;
+            return path.slice(0, i);
+        });
+    });
+
+    for (const fact of added) {
+        if (fact.head !== 'Parent' || fact.args.length !== 2) continue;
+        const [parent, child] = fact.args;
+
+        // The newly linked person may already have a lineage of their own, so
+        // splice in their existing ancestors/descendants rather than just them
+        const ancestorPrefixes = [];
+        if (child === currentPerson) ancestorPrefixes.push([]);
+        ancestors.forEach(path => {
+            const i = path.findIndex(person => person.name === child);
+            if (i !== -1) ancestorPrefixes.push(path.slice(0, i + 1));
+        });
+        if (ancestorPrefixes.length) {
+            const lineage = await fetchLineage('ancestors', parent);
+            const linked = { name: parent, sex: knownSex(parent) };
+            ancestorPrefixes.forEach(prefix => {
+                const base = prefix.concat([linked]);
+                if (lineage.length === 0) {
+                    ancestors.push(base);
+                } else {
+                    lineage.forEach(rest => ancestors.push(base.concat(rest)));
+                }
+            });
+            changed = true;
+        }
+
+        const descendantPrefixes = [];
+        if (parent === currentPerson) descendantPrefixes.push([]);
+        descendants.forEach(path => {
+            const i = path.findIndex(person => person.name === parent);
+            if (i !== -1) descendantPrefixes.push(path.slice(0, i + 1));
+        });
+        if (descendantPrefixes.length) {
+            const lineage = await fetchLineage('descendants', child);
+            const linked = { name: child, sex: knownSex(child) };
+            descendantPrefixes.forEach(prefix => {
+                const base = prefix.concat([linked]);
+                if (lineage.length === 0) {
+                    descendants.push(base);
+                } else {
+                    lineage.forEach(rest => descendants.push(base.concat(rest)));
+                }
+            });
+            changed = true;
+        }
+    }
+
+    Object.keys(sexes).forEach(name => {
+        ancestors.concat(descendants).forEach(path => {
+            path.forEach((person, idx) => {
+                if (person.name === name && person.sex !== sexes[name]) {
+                    path[idx] = { name: person.name, sex: sexes[name] };
+                    changed = true;
+                }
+            });
+        });
+    });
+
+    // The user may have moved to another tree while lineages were being fetched
+    if (!changed || person !== currentPerson) return;
+
+    treeData = { ancestors: dedupePaths(ancestors), descendants: dedupePaths(descendants) };
+    buildFamilyTree(currentPerson, treeData.ancestors, treeData.descendants);
+}
+
 // Initialize the application
 document.addEventListener('DOMContentLoaded', function() {
     console.log("DOM Content Loaded");
     
     // Initialize Cytoscape
     initCytoscape();
+
+    // Subscribe to live knowledge base updates
+    connectKbFeed();
     
     // Add initial chat message
     setTimeout(() => {
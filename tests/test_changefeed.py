@@ -0,0 +1,132 @@
+import asyncio
+import json
+
+from backend.changefeed import SUBSCRIBER_QUEUE_SIZE, ChangeFeed
+
+
+def parse(chunk):
+    fields = dict(line.split(": ", 1) for line in chunk.strip().splitlines())
+    return fields.get("id"), fields["event"], json.loads(fields["data"])
+
+
+async def take(stream, count):
+    return [parse(await stream.__anext__()) for _ in range(count)]
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_live_deltas_carry_epoch_and_generation():
+    async def scenario():
+        feed = ChangeFeed()
+        stream = feed.stream()
+        (hello_id, event, hello), = await take(stream, 1)
+        feed.publish(added=["(Parent Adam Zed)"], removed=[])
+        (event_id, delta_event, delta), = await take(stream, 1)
+        await stream.aclose()
+        return feed, hello_id, event, hello, event_id, delta_event, delta
+
+    feed, hello_id, event, hello, event_id, delta_event, delta = run(scenario())
+    assert (event, hello) == ("hello", {"epoch": feed.epoch, "generation": 0})
+    assert hello_id == f"{feed.epoch}-0"
+    assert event_id == f"{feed.epoch}-1"
+    assert delta_event == "kb_delta"
+    assert delta == {"epoch": feed.epoch, "generation": 1, "added": ["(Parent Adam Zed)"], "removed": []}
+
+
+def test_reconnect_replays_missed_deltas():
+    async def scenario():
+        feed = ChangeFeed()
+        for i in range(3):
+            feed.publish(added=[f"(male P{i})"], removed=[])
+        stream = feed.stream(last_event_id=f"{feed.epoch}-1")
+        events = await take(stream, 3)
+        await stream.aclose()
+        return feed, events
+
+    feed, events = run(scenario())
+    assert [event for _, event, _ in events] == ["hello", "kb_delta", "kb_delta"]
+    assert events[0][0] == f"{feed.epoch}-1"
+    assert events[0][2]["generation"] == 1
+    assert [data["generation"] for _, _, data in events[1:]] == [2, 3]
+    assert events[2][0] == f"{feed.epoch}-3"
+
+
+def test_drop_after_hello_replays_deltas_published_meanwhile():
+    async def scenario():
+        feed = ChangeFeed()
+        stream = feed.stream()
+        (hello_id, _, _), = await take(stream, 1)
+        await stream.aclose()
+        feed.publish(added=["(male P)"], removed=[])
+        # EventSource reconnects with the id of the last event it saw: hello's
+        stream = feed.stream(last_event_id=hello_id)
+        events = await take(stream, 2)
+        await stream.aclose()
+        return events
+
+    events = run(scenario())
+    assert [event for _, event, _ in events] == ["hello", "kb_delta"]
+    assert events[1][2]["added"] == ["(male P)"]
+
+
+def test_stale_epoch_gets_resync():
+    async def scenario():
+        feed = ChangeFeed()
+        for i in range(5):
+            feed.publish(added=[f"(male P{i})"], removed=[])
+        # An id from a previous server process, lower than the current generation
+        stream = feed.stream(last_event_id="0123456789ab-3")
+        events = await take(stream, 1)
+        await stream.aclose()
+        return feed, events
+
+    feed, [(event_id, event, data)] = run(scenario())
+    assert event == "resync"
+    assert data == {"epoch": feed.epoch, "generation": 5}
+    assert event_id == f"{feed.epoch}-5"
+
+
+def test_unparseable_last_event_id_gets_resync():
+    async def scenario():
+        feed = ChangeFeed()
+        feed.publish(added=["(male P)"], removed=[])
+        stream = feed.stream(last_event_id="3")
+        events = await take(stream, 1)
+        await stream.aclose()
+        return events
+
+    [(_, event, _)] = run(scenario())
+    assert event == "resync"
+
+
+def test_history_gap_gets_resync(monkeypatch):
+    monkeypatch.setattr("backend.changefeed.HISTORY_SIZE", 2)
+
+    async def scenario():
+        feed = ChangeFeed()
+        for i in range(5):
+            feed.publish(added=[f"(male P{i})"], removed=[])
+        stream = feed.stream(last_event_id=f"{feed.epoch}-1")
+        events = await take(stream, 1)
+        await stream.aclose()
+        return events
+
+    [(_, event, data)] = run(scenario())
+    assert (event, data["generation"]) == ("resync", 5)
+
+
+def test_queue_overflow_gets_resync():
+    async def scenario():
+        feed = ChangeFeed()
+        stream = feed.stream()
+        await take(stream, 1)
+        for i in range(SUBSCRIBER_QUEUE_SIZE + 1):
+            feed.publish(added=[f"(male P{i})"], removed=[])
+        events = await take(stream, 1)
+        await stream.aclose()
+        return events
+
+    [(_, event, data)] = run(scenario())
+    assert (event, data["generation"]) == ("resync", SUBSCRIBER_QUEUE_SIZE + 1)
@@ -0,0 +1,121 @@
+import os
+import signal
+
+import pytest
+
+pytest.importorskip("hyperon")
+
+from backend import partition_check
+from backend.partitions import PartitionedKB, owner
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+KB = """
+(Parent Adam Charles)
+(Parent Adam Edward)
+(Parent Charles Frank)
+(male Adam)
+(male Charles)
+(male Edward)
+(male Frank)
+"""
+
+
+@pytest.fixture
+def kb_path(tmp_path):
+    path = tmp_path / "kb.metta"
+    path.write_text(KB)
+    return path
+
+
+@pytest.fixture
+def kb(kb_path):
+    partitioned = PartitionedKB([str(kb_path)], 3)
+    partitioned.reload()
+    yield partitioned
+    partitioned.shutdown()
+
+
+def kill(kb, person):
+    process, _ = kb._workers[owner(person, kb.count)]
+    process.kill()
+    process.join()
+
+
+def test_partitioned_kb_matches_single_space(monkeypatch):
+    monkeypatch.setattr(partition_check, "INFER_FILE_PATH", os.path.join(REPO_ROOT, "backend", "logic", "infer.metta"))
+    assert partition_check.check(partitions=3, generations=2, seed=5) == 0
+
+
+def test_dead_worker_is_restarted_on_next_use(kb):
+    kill(kb, "Adam")
+
+    assert kb.children("Adam") == ["Charles", "Edward"]
+    assert kb.ancestor_paths("Frank") == [
+        [{"name": "Charles", "sex": "male"}, {"name": "Adam", "sex": "male"}],
+    ]
+
+
+def test_worker_dying_mid_request_raises_then_recovers(kb, monkeypatch):
+    receive = kb._receive
+
+    def die_before_reply(index, request_id):
+        monkeypatch.setattr(kb, "_receive", receive)
+        kill(kb, "Adam")
+        return receive(index, request_id)
+
+    monkeypatch.setattr(kb, "_receive", die_before_reply)
+    with pytest.raises(RuntimeError, match="restarted"):
+        kb.children("Adam")
+
+    assert kb.children("Adam") == ["Charles", "Edward"]
+
+
+def test_stale_replies_are_discarded(kb):
+    index = owner("Adam", kb.count)
+    with kb._locks[index]:
+        kb._send(index, "children", ["Edward"])
+    assert kb.children("Adam") == ["Charles", "Edward"]
+
+
+def test_restart_after_remove_keeps_results(kb, kb_path):
+    kb_path.write_text(KB.replace("(Parent Adam Charles)\n", ""))
+    assert kb.remove_facts(["(Parent Adam Charles)"]) == len({owner("Adam", 3), owner("Charles", 3)})
+    assert kb.remove_facts(["(Parent Adam Charles)"]) == 0
+    kill(kb, "Adam")
+    kill(kb, "Charles")
+
+    assert kb.children("Adam") == ["Edward"]
+    assert kb.ancestor_paths("Frank") == [[{"name": "Charles", "sex": "male"}]]
+
+
+def test_names_that_are_not_plain_symbols_are_rejected(kb):
+    for name in ["A) $r) (x", "$r", "Adam Beth"]:
+        with pytest.raises(ValueError, match="Invalid person name"):
+            kb.children(name)
+
+    kb.add_facts(["(male Zed)", "(Parent Zed Adam)"])
+    assert kb.ancestor_paths("Charles") == [
+        [{"name": "Adam", "sex": "male"}, {"name": "Zed", "sex": "male"}],
+    ]
+
+
+def test_workers_refuse_facts_that_are_not_plain_symbols(kb):
+    with pytest.raises(RuntimeError, match="plain symbols"):
+        kb._scatter({0: ("add", ["(Parent $x Adam)"])})
+    assert kb.children("Adam") == ["Charles", "Edward"]
+
+
+def test_hung_worker_times_out_and_is_restarted(kb_path):
+    kb = PartitionedKB([str(kb_path)], 3, timeout=2)
+    try:
+        kb.reload()
+        process, _ = kb._workers[owner("Adam", kb.count)]
+        os.kill(process.pid, signal.SIGSTOP)
+
+        with pytest.raises(RuntimeError, match="TimeoutError"):
+            kb.children("Adam")
+        assert kb._workers[owner("Adam", kb.count)][0].pid != process.pid
+        assert kb.children("Adam") == ["Charles", "Edward"]
+    finally:
+        kb.shutdown()
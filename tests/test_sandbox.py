@@ -0,0 +1,126 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("hyperon")
+
+from backend.sandbox import QuerySandbox
+
+KB = """
+(Parent Adam Charles)
+(Parent Adam Edward)
+(male Adam)
+(male Charles)
+(male Edward)
+"""
+
+RULES = """
+(= (children $x) (match &self (Parent $x $y) $y))
+"""
+
+
+@pytest.fixture
+def make_sandbox(tmp_path):
+    kb_path = tmp_path / "kb.metta"
+    infer_path = tmp_path / "infer.metta"
+    kb_path.write_text(KB)
+    infer_path.write_text(RULES)
+    sandboxes = []
+
+    def make(**overrides):
+        options = dict(timeout=10, max_steps=20000, max_results=100)
+        options.update(overrides)
+        sandbox = QuerySandbox(str(kb_path), str(infer_path), **options)
+        sandboxes.append(sandbox)
+        return sandbox
+
+    yield make
+    for sandbox in sandboxes:
+        sandbox.shutdown()
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_runs_query_against_kb(make_sandbox):
+    result = run(make_sandbox().run("!(children Adam)"))
+    assert sorted(result) == ["Charles", "Edward"]
+
+
+def test_tight_loop_hits_step_budget(make_sandbox):
+    result = run(make_sandbox(max_steps=1000).run("(= (loop $x) (loop $x)) !(loop 1)"))
+    assert result == [{"error": "Query exceeded the reduction budget of 1000 steps."}]
+
+
+def test_tight_loop_hits_time_budget(make_sandbox):
+    result = run(make_sandbox(timeout=0.5, max_steps=10**9).run("(= (loop $x) (loop $x)) !(loop 1)"))
+    assert result == [{"error": "Query exceeded the time budget of 0.5 seconds."}]
+
+
+def test_results_are_capped(make_sandbox):
+    result = run(make_sandbox(max_results=2).run("!(superpose (1 2 3 3 4 5))"))
+    assert result == ["1", "2", {"warning": "Result truncated to the first 2 results."}]
+
+
+def test_disconnected_client_cancels_query(make_sandbox):
+    async def disconnected():
+        return True
+
+    sandbox = make_sandbox(max_steps=10**9)
+    result = run(sandbox.run("(= (loop $x) (loop $x)) !(loop 1)", is_disconnected=disconnected))
+    assert result == [{"error": "Query cancelled because the client disconnected."}]
+
+
+def test_refuses_queries_beyond_worker_limit(make_sandbox):
+    sandbox = make_sandbox(timeout=1, max_steps=10**9, max_workers=1)
+
+    async def both():
+        return await asyncio.gather(
+            sandbox.run("(= (loop $x) (loop $x)) !(loop 1)"),
+            sandbox.run("!(children Adam)"),
+        )
+
+    first, second = run(both())
+    assert first == [{"error": "Query exceeded the time budget of 1 seconds."}]
+    assert second == [{"error": "Too many raw queries are running (limit 1). Try again shortly."}]
+
+
+def test_memory_limit_contains_worker(make_sandbox):
+    result = run(make_sandbox(memory_limit_mb=1, startup_timeout=5).run("!(children Adam)"))
+    assert len(result) == 1 and "error" in result[0]
+
+
+def test_worker_start_and_stop_do_not_block_event_loop(make_sandbox, monkeypatch):
+    sandbox = make_sandbox()
+    take_worker, stop = sandbox._take_worker, sandbox._stop
+
+    def slow_take_worker():
+        time.sleep(0.5)
+        return take_worker()
+
+    def slow_stop(worker):
+        time.sleep(0.5)
+        stop(worker)
+
+    monkeypatch.setattr(sandbox, "_take_worker", slow_take_worker)
+    monkeypatch.setattr(sandbox, "_stop", slow_stop)
+
+    async def scenario():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        result = await sandbox.run("!(children Adam)")
+        ticker.cancel()
+        return result, ticks
+
+    result, ticks = run(scenario())
+    assert sorted(result) == ["Charles", "Edward"]
+    assert ticks >= 50